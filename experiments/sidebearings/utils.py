@@ -1,42 +1,169 @@
-from functools import lru_cache
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 
-import random
+import os
 import itertools
 
+import numpy as np
 from scipy import stats
 
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
 
-def read_side_bearings(font, weights=('ExtraLight','Regular','Black')):
+    def njit(*args, **kwargs):
+        # Without numba, the kernels below stay plain Python and the node loops use glyphsLib objects instead
+        return lambda func: func
+
+
+# Axis of the coordinate that a direction measures (0 for x, 1 for y)
+_DIR_AXIS = {'lsb': 0, 'rsb': 0, 'tsb': 1, 'bsb': 1}
+# Sign that makes the outermost coordinate of a direction the largest one
+_DIR_SIGN = {'lsb': -1, 'bsb': -1, 'rsb': 1, 'tsb': 1}
+# Record layout of the side bearing arrays, one record per character
+_SIDE_BEARING_DTYPE = np.dtype([('lsb', 'f8'), ('rsb', 'f8'), ('bsb', 'f8'), ('tsb', 'f8')])
+
+
+def _read_master_side_bearings(font, master):
     # Get baseline offset and height data
-    baseline = {}
-    height = {}
-    for master in font.masters:
-        if master.name not in weights:
-            continue
-        baseline[master.name] = master.descender
-        height[master.name] = master.ascender - master.descender
+    baseline = master.descender
+    height = master.ascender - master.descender
 
     # Get side bearing data of all glyphs
-    data = {weight: {} for weight in weights}
+    data = {}
     for glyph in font.glyphs:
-        for layer in glyph.layers:
-            master_name = layer.master.name
-            if master_name not in weights:
-                continue 
-            if layer.bounds is None:
-                # Not drawn yet
-                continue
-            lsb = layer.bounds.origin.x
-            rsb = layer.width - lsb - layer.bounds.size.width
-            bsb = layer.bounds.origin.y - baseline[master_name]
-            tsb = height[master_name] - bsb - layer.bounds.size.height
-            data[master_name][glyph.string] = {'id': glyph.id, 'lsb': lsb, 'rsb': rsb, 'bsb': bsb, 'tsb': tsb}
+        layer = glyph.layers[master.id]
+        # glyphsLib recomputes the bounds on every access
+        bounds = layer.bounds if layer is not None else None
+        if bounds is None:
+            # Not drawn yet
+            continue
+        lsb = bounds.origin.x
+        rsb = layer.width - lsb - bounds.size.width
+        bsb = bounds.origin.y - baseline
+        tsb = height - bsb - bounds.size.height
+        data[glyph.string] = {'id': glyph.id, 'lsb': lsb, 'rsb': rsb, 'bsb': bsb, 'tsb': tsb}
         # for tag in glyph.tags:
         #     print(tag)
     return data
 
 
-def dist_between_rankings(sb_data, direction):
+def read_side_bearings(font, weights=('ExtraLight','Regular','Black'), return_arrays=False):
+    data = {weight: {} for weight in weights}
+    for master in font.masters:
+        if master.name not in weights:
+            continue
+        data[master.name] = _read_master_side_bearings(font, master)
+    if return_arrays:
+        return data, *side_bearings_to_arrays(data)
+    return data
+
+
+def _common_chars(sb_data):
+    '''Returns the sorted characters present in every weight of sb_data.'''
+    weights = list(sb_data.keys())
+    common = sb_data[weights[0]].keys()
+    for weight in weights[1:]:
+        common = common & sb_data[weight].keys()
+    # Sorting keeps the tie-breaking order of rankings stable across runs (unencoded glyphs are keyed by None)
+    return sorted(common, key=str)
+
+
+def _direction_values(sb_data, weights, chars, direction):
+    '''Returns a (weights, chars) array of the side bearings at the given direction.'''
+    return np.array([
+        np.fromiter((sb_data[weight][char][direction] for char in chars), dtype=np.float64, count=len(chars))
+        for weight in weights
+    ])
+
+
+def side_bearings_to_arrays(sb_data):
+    '''
+    Flattens side bearing data into one structured array per weight, with a field per direction.
+    Rows cover the characters common to all weights, and the returned mapping gives the row of each character.
+    The result can be passed to the ranking functions as `arrays` to skip reading the dicts on every call.
+    '''
+    weights = list(sb_data.keys())
+    common_chars = _common_chars(sb_data)
+    char_to_idx = {char: i for i, char in enumerate(common_chars)}
+    sb_arrays = {weight: np.empty(len(common_chars), dtype=_SIDE_BEARING_DTYPE) for weight in weights}
+    for direction in _SIDE_BEARING_DTYPE.names:
+        for weight, values in zip(weights, _direction_values(sb_data, weights, common_chars, direction)):
+            sb_arrays[weight][direction] = values
+    return sb_arrays, char_to_idx
+
+
+def _ranking_values(sb_data, direction, arrays):
+    '''
+    Returns the weights, their (weights, chars) array of side bearings at the given direction, and the chars.
+    Reads the precomputed arrays of `side_bearings_to_arrays` if given, otherwise only the needed direction of sb_data.
+    '''
+    if arrays is not None:
+        sb_arrays, char_to_idx = arrays
+        weights = list(sb_arrays.keys())
+        return weights, np.stack([sb_arrays[weight][direction] for weight in weights]), list(char_to_idx)
+    weights = list(sb_data.keys())
+    common_chars = _common_chars(sb_data)
+    return weights, _direction_values(sb_data, weights, common_chars, direction), common_chars
+
+
+def _count_inversions(seq):
+    '''
+    Counts the pairs i < j with seq[i] > seq[j] in a sequence of distinct integers.
+    Uses a bottom-up merge sort (Knight's algorithm), where each level is done in NumPy.
+    '''
+    n = len(seq)
+    if n < 2:
+        return 0
+    # Pad to a power of two with increasing values above the maximum, which adds no inversions
+    size = 1 << (n - 1).bit_length()
+    top = int(seq.max()) + 1
+    arr = np.concatenate([seq, top + np.arange(size - n)])
+    offset = top + size # Larger than any value, so shifted blocks stay globally sorted
+    inversions = 0
+    width = 1
+    while width < size:
+        blocks = arr.reshape(-1, 2, width)
+        shift = np.arange(len(blocks))[:, None] * offset
+        left = (blocks[:, 0] + shift).ravel()
+        right = (blocks[:, 1] + shift).ravel()
+        # For each element of a right block, count the greater elements in its left block
+        ends = np.repeat(np.arange(1, len(blocks) + 1) * width, width)
+        inversions += int((ends - np.searchsorted(left, right, side='right')).sum())
+        arr = np.sort(blocks.reshape(-1, 2 * width), axis=1).ravel()
+        width *= 2
+    return inversions
+
+
+def _kendall_tau(rank1, rank2):
+    '''
+    Kendall's tau between two ordinal (tie-free) rankings of the same items.
+    Skips the input validation and p-value computation of `stats.kendalltau`.
+    Note that pandas' `Series.corr(method='kendall')` calls `stats.kendalltau` as well, so it is no faster.
+    '''
+    n = len(rank1)
+    if n < 2:
+        return np.nan
+    discordant = _count_inversions(rank2[np.argsort(rank1)])
+    # Without ties, tau = (C - D) / (n * (n - 1) / 2) where C + D = n * (n - 1) / 2
+    return 1 - 4 * discordant / (n * (n - 1))
+
+
+def _batched_kendall_tau(ranks1, ranks2):
+    '''
+    Kendall's tau between each row of two (samples, n) arrays of ordinal rankings.
+    Compares all pairs directly by broadcasting, which is cheap for small batches.
+    '''
+    n = ranks1.shape[1]
+    signs1 = np.sign(ranks1[:, :, None] - ranks1[:, None, :]).astype(np.int8)
+    signs2 = np.sign(ranks2[:, :, None] - ranks2[:, None, :]).astype(np.int8)
+    # Every pair is counted twice (as i, j and j, i), hence n * (n - 1) instead of n * (n - 1) / 2
+    return (signs1 * signs2).sum(axis=(1, 2)) / (n * (n - 1))
+
+
+def dist_between_rankings(sb_data, direction, arrays=None):
     direction = direction.lower()
     assert direction in ('lsb', 'rsb', 'tsb', 'bsb')
 
@@ -44,20 +171,34 @@ def dist_between_rankings(sb_data, direction):
     # An alternative to consider is Rank Biased Overlap (RBO)
     # IMPORTANT: We calculate Kendall's tau between ALL pairs of rankings.
     # This is to accommodate for one odd ranking in the middle having too much impact on the overall score.
-    weights = list(sb_data.keys())
+    weights, values, common_chars = _ranking_values(sb_data, direction, arrays)
     if len(weights) == 1:
         return 1
     scores = []
-    common_chars = list(set.intersection(*[set(sb_data[weight].keys()) for weight in weights])) # List is important to guarantee stable sort
+    # Rank each weight once; ordinal ranks break ties by position, just like a stable sort
+    ranks = dict(zip(weights, stats.rankdata(values, axis=1, method='ordinal').astype(np.int64)))
     for weight1, weight2 in itertools.combinations(weights, 2): # Can shorten to combining weights.values()
-        ranking1 = sorted(common_chars, key=lambda char: sb_data[weight1][char][direction])
-        ranking2 = sorted(common_chars, key=lambda char: sb_data[weight2][char][direction])
-        tau = stats.kendalltau(ranking1, ranking2)
-        scores.append((weight1, weight2, tau.statistic))
+        tau = _kendall_tau(ranks[weight1], ranks[weight2])
+        scores.append((weight1, weight2, tau))
+    ranking1 = [common_chars[i] for i in np.argsort(ranks[weight1])]
+    ranking2 = [common_chars[i] for i in np.argsort(ranks[weight2])]
     return scores, ranking1, ranking2
 
 
-def dist_between_rankings_random_batches(sb_data, direction, batch_size=50, samples=100):
+def _batch_scores(values, batches):
+    '''
+    Kendall's tau of each batch (columns) for every pair of weights (rows).
+    values is a (weights, chars) array and batches a (samples, batch_size) array of char indices.
+    '''
+    # Ordinal ranks of every batch under each weight, ties broken by position like a stable sort
+    batch_ranks = np.argsort(np.argsort(values[:, batches], axis=2, kind='stable'), axis=2)
+    return np.array([
+        _batched_kendall_tau(batch_ranks[w1], batch_ranks[w2])
+        for w1, w2 in itertools.combinations(range(len(values)), 2) # Can shorten to combining weights.values()
+    ])
+
+
+def dist_between_rankings_random_batches(sb_data, direction, batch_size=50, samples=100, n_jobs=None, seed=None, arrays=None):
     direction = direction.lower()
     assert direction in ('lsb', 'rsb', 'tsb', 'bsb')
 
@@ -65,59 +206,190 @@ def dist_between_rankings_random_batches(sb_data, direction, batch_size=50, samp
     # An alternative to consider is Rank Biased Overlap (RBO)
     # IMPORTANT: We calculate Kendall's tau between ALL pairs of rankings.
     # This is to accommodate for one odd ranking in the middle having too much impact on the overall score.
-    weights = list(sb_data.keys())
+    weights, values, common_chars = _ranking_values(sb_data, direction, arrays)
     if len(weights) == 1:
         return 1
-    scores = []
-    common_chars = list(set.intersection(*[set(sb_data[weight].keys()) for weight in weights])) # List is important to guarantee stable sort
-    for i in range(samples):
-        batch = random.choices(common_chars, k=batch_size) # Should we consider non-replacement?
-        batch_scores = []
-        for weight1, weight2 in itertools.combinations(weights, 2): # Can shorten to combining weights.values()
-            ranking1 = sorted(batch, key=lambda char: sb_data[weight1][char][direction])
-            ranking2 = sorted(batch, key=lambda char: sb_data[weight2][char][direction])
-            tau = stats.kendalltau(ranking1, ranking2)
-            batch_scores.append(tau.statistic)
-        scores.append(batch_scores)
-    # Calculate mean scores
-    scores = list(map(lambda s: sum(s) / len(s), zip(*scores)))
+    rng = np.random.default_rng(seed)
+    batches = rng.integers(0, len(common_chars), size=(samples, batch_size)) # Should we consider non-replacement?
+    # Samples are independent, so split them across threads (NumPy releases the GIL while sorting and reducing)
+    # Like joblib, n_jobs=-1 uses all CPUs, -2 all but one, and so on
+    cpu_count = os.cpu_count() or 1
+    if n_jobs is None:
+        n_jobs = cpu_count
+    elif n_jobs < 0:
+        n_jobs = max(1, cpu_count + 1 + n_jobs)
+    elif n_jobs == 0:
+        raise ValueError('n_jobs must be a positive integer, a negative one counting back from the CPU count, or None')
+    chunks = np.array_split(batches, max(1, min(samples, n_jobs)))
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pair_scores = np.concatenate(list(executor.map(partial(_batch_scores, values), chunks)), axis=1)
+    # Calculate mean scores over all samples
+    scores = pair_scores.mean(axis=1).tolist()
     return scores
 
 
-def compare_node_to_record(node, record, direction):
-    coord = get_coord_at_direction(node, direction)
+def compare_node_to_record(node, record, axis, sign):
+    coord = node.position.x if axis == 0 else node.position.y
     if record is None:
         return 1, coord
-    if direction in ('lsb', 'bsb'):
-        if coord < record:
-            return 1, coord
-        elif coord == record:
-            return 0, record
-        return -1, record
-    else:
-        if coord > record:
-            return 1, coord
-        elif coord == record:
-            return 0, record
-        return -1, record
+    diff = sign * (coord - record)
+    if diff > 0:
+        return 1, coord
+    elif diff == 0:
+        return 0, record
+    return -1, record
+
+
+@lru_cache(maxsize=4096)
+def _layer_to_arrays(layer):
+    '''
+    Flattens the nodes of all paths in a layer into arrays for the JIT kernels.
+    Node types are 1 for handle (offcurve) nodes and 0 otherwise, and path i spans path_starts[i]:path_starts[i + 1].
+    Cached since every layer is scanned once per direction.
+    '''
+    xs = []
+    ys = []
+    types = []
+    path_starts = [0]
+    closed = []
+    for path in layer.paths:
+        for node in path.nodes:
+            xs.append(node.position.x)
+            ys.append(node.position.y)
+            types.append(node.type == 'offcurve')
+        path_starts.append(len(xs))
+        closed.append(path.closed)
+    return (
+        np.array(xs, dtype=np.float64),
+        np.array(ys, dtype=np.float64),
+        np.array(types, dtype=np.int8),
+        np.array(path_starts, dtype=np.int32),
+        np.array(closed, dtype=np.bool_),
+    )
+
 
+@lru_cache(maxsize=4096)
+def _layer_path_bounds(layer):
+    '''
+    Returns the per-path minimum and maximum (x, y) of on-curve nodes as two (paths, 2) arrays.
+    Paths without on-curve nodes get infinite bounds, so they never reach a record.
+    '''
+    xs, ys, types, path_starts, _ = _layer_to_arrays(layer)
+    on_curve = types == 0
+    path_ids = np.repeat(np.arange(len(path_starts) - 1), np.diff(path_starts))[on_curve]
+    positions = np.stack([xs, ys], axis=1)[on_curve]
+    path_min = np.full((len(path_starts) - 1, 2), np.inf)
+    path_max = np.full((len(path_starts) - 1, 2), -np.inf)
+    np.minimum.at(path_min, path_ids, positions)
+    np.maximum.at(path_max, path_ids, positions)
+    return path_min, path_max
 
-def get_coord_at_direction(node, direction, opposite=False):
-    '''Returns the respective node coordinate at the given direction.'''
-    if opposite:
-        return node.position.y if direction in ('lsb', 'rsb') else node.position.x
-    return node.position.x if direction in ('lsb', 'rsb') else node.position.y
 
+@njit(cache=True)
+def _compare_to_record_nb(coord, record, has_record, dir_sign):
+    if not has_record:
+        return 1
+    diff = dir_sign * (coord - record)
+    if diff > 0:
+        return 1
+    elif diff == 0:
+        return 0
+    return -1
 
-def get_midpoint(node_start, node_end, direction):
-    if direction in ('lsb', 'rsb'):
-        return (node_start.position.y + node_end.position.y) / 2
-    return (node_start.position.x + node_end.position.x) / 2
+
+@njit(cache=True)
+def _outermost_strokes_nb(xs, ys, types, path_starts, closed, dir_axis, dir_sign):
+    '''Same state machine as the node loop in `get_outermost_strokes`, with nodes referred to by index.'''
+    coords = xs if dir_axis == 0 else ys
+    opposite = ys if dir_axis == 0 else xs
+    outermost_points = np.empty(len(xs), dtype=np.float64) # At most one stroke per node
+    n_points = 0
+    record = 0.0
+    has_record = False
+    for p in range(len(path_starts) - 1):
+        start = path_starts[p]
+        end = path_starts[p + 1]
+        stroke_start = -1
+        stroke_end = -1
+        for i in range(start, end):
+            if types[i] == 1:
+                continue
+            comparison = _compare_to_record_nb(coords[i], record, has_record, dir_sign)
+            if comparison == -1:
+                if stroke_end != -1:
+                    outermost_points[n_points] = (opposite[stroke_start] + opposite[stroke_end]) / 2
+                    n_points += 1
+                    stroke_start = -1
+                    stroke_end = -1
+            elif comparison == 1:
+                record = coords[i]
+                has_record = True
+                n_points = 0
+                stroke_start = i
+                stroke_end = i
+            else:
+                if stroke_start == -1:
+                    stroke_start = i
+                stroke_end = i
+        if stroke_end != -1:
+            if closed[p] and _compare_to_record_nb(coords[start], record, has_record, dir_sign) == 0:
+                if n_points > 0:
+                    outermost_points[:n_points - 1] = outermost_points[1:n_points].copy()
+                    n_points -= 1
+                for i in range(start, end):
+                    if i == stroke_start:
+                        break
+                    comparison = _compare_to_record_nb(coords[i], record, has_record, dir_sign)
+                    if comparison == 0:
+                        stroke_end = i
+                    elif comparison == -1:
+                        break
+            outermost_points[n_points] = (opposite[stroke_start] + opposite[stroke_end]) / 2
+            n_points += 1
+    return outermost_points[:n_points], record, has_record
 
 
+@njit(cache=True)
+def _outermost_range_nb(xs, ys, types, path_starts, path_min, path_max, dir_axis, dir_sign):
+    '''Same scan as the node loop in `get_outermost_range`, returning the range bounds separately.'''
+    coords = xs if dir_axis == 0 else ys
+    opposite = ys if dir_axis == 0 else xs
+    record = 0.0
+    has_record = False
+    range_start = 0.0
+    range_end = 0.0
+    for p in range(len(path_starts) - 1):
+        # Skip paths whose outermost node cannot reach the current record
+        path_extreme = path_max[p, dir_axis] if dir_sign > 0 else path_min[p, dir_axis]
+        if has_record and dir_sign * (path_extreme - record) < 0:
+            continue
+        for i in range(path_starts[p], path_starts[p + 1]):
+            if types[i] == 1:
+                continue
+            comparison = _compare_to_record_nb(coords[i], record, has_record, dir_sign)
+            if comparison == 1:
+                record = coords[i]
+                has_record = True
+                range_start = opposite[i]
+                range_end = opposite[i]
+            elif comparison == 0:
+                if opposite[i] < range_start:
+                    range_start = opposite[i]
+                elif opposite[i] > range_end:
+                    range_end = opposite[i]
+    return range_start, range_end, record, has_record
+
+
+@lru_cache(maxsize=32768)
 def get_outermost_strokes(layer, direction):
     direction = direction.lower()
     assert direction in ('lsb', 'rsb', 'tsb', 'bsb')
+    axis = _DIR_AXIS[direction]
+    sign = _DIR_SIGN[direction]
+
+    if _NUMBA_AVAILABLE:
+        outermost_points, record, has_record = _outermost_strokes_nb(*_layer_to_arrays(layer), axis, sign)
+        return outermost_points.tolist(), record if has_record else None
 
     # Idea: all adjacent outermost point counts as one stroke
     record = None
@@ -130,10 +402,10 @@ def get_outermost_strokes(layer, direction):
                 # Skip handle nodes
                 # IMPORTANT: This assumes that outermost pixels are determined by nodes, rather than curves, which is also best practice
                 continue
-            comparison, new_record = compare_node_to_record(node, record, direction)
+            comparison, new_record = compare_node_to_record(node, record, axis, sign)
             if comparison == -1: # Does not break record
                 if stroke_end is not None: # Record breaking stroke has ended
-                    outermost_points.append(get_midpoint(stroke_start, stroke_end, direction))
+                    outermost_points.append((stroke_start.position.y + stroke_end.position.y) / 2 if axis == 0 else (stroke_start.position.x + stroke_end.position.x) / 2)
                     stroke_start = None
                     stroke_end = None
             elif comparison == 1: # Breaks outermost record
@@ -146,17 +418,17 @@ def get_outermost_strokes(layer, direction):
                     stroke_start = node
                 stroke_end = node # Otherwise, currently on a record breaking stroke, still have to update end node
         if stroke_end is not None: # When outermost stroke ends with path (either individual stroke or one that extends into the initial nodes)
-            if path.closed and compare_node_to_record(path.nodes[0], record, direction)[0] == 0: # Check if the last stroke continues to the intial stroke (hence double counted)
+            if path.closed and compare_node_to_record(path.nodes[0], record, axis, sign)[0] == 0: # Check if the last stroke continues to the intial stroke (hence double counted)
                 del outermost_points[0] # Remove the incomplete initial stroke
                 for node in path.nodes: # Extend this stroke to the farthest initial node
                     if node == stroke_start:
                         break
-                    comparison, _ = compare_node_to_record(node, record, direction)
+                    comparison, _ = compare_node_to_record(node, record, axis, sign)
                     if comparison == 0:
                         stroke_end = node
                     elif comparison == -1:
                         break
-            outermost_points.append(get_midpoint(stroke_start, stroke_end, direction))
+            outermost_points.append((stroke_start.position.y + stroke_end.position.y) / 2 if axis == 0 else (stroke_start.position.x + stroke_end.position.x) / 2)
             stroke_start = None
             stroke_end = None
 
@@ -167,25 +439,34 @@ def get_outermost_strokes(layer, direction):
 def get_outermost_range(layer, direction):
     direction = direction.lower()
     assert direction in ('lsb', 'rsb', 'tsb', 'bsb')
+    axis = _DIR_AXIS[direction]
+    sign = _DIR_SIGN[direction]
+
+    if _NUMBA_AVAILABLE:
+        xs, ys, types, path_starts, _ = _layer_to_arrays(layer)
+        path_min, path_max = _layer_path_bounds(layer)
+        range_start, range_end, record, has_record = _outermost_range_nb(xs, ys, types, path_starts, path_min, path_max, axis, sign)
+        if not has_record:
+            return [-1, None], None
+        return [range_start, range_end], record
 
     record = None
     outermost_range = [-1, None]
     for path in layer.paths:
-        # Possible optimization: check bound of each path to see if it lies within record
+        # Paths are not skipped by bounds here: glyphsLib recomputes path.bounds from segments on every access, costing more than this scan
         for node in path.nodes:
             if node.type == 'offcurve':
                 # Skip handle nodes
                 # IMPORTANT: This assumes that outermost pixels are determined by nodes, rather than curves, which is also best practice
                 continue
-            comparison, new_record = compare_node_to_record(node, record, direction)
+            comparison, new_record = compare_node_to_record(node, record, axis, sign)
             if comparison == -1: # Does not break record
                 continue
-            elif comparison == 1: # Breaks outermost record
+            coord = node.position.y if axis == 0 else node.position.x # Coordinate along the opposite axis
+            if comparison == 1: # Breaks outermost record
                 record = new_record
-                coord = get_coord_at_direction(node, direction, opposite=True)
                 outermost_range = [coord, coord]
             else: # Same with current record
-                coord = get_coord_at_direction(node, direction, opposite=True)
                 if None in outermost_range: # First time updating
                     outermost_range = [coord, coord]
                 elif coord < outermost_range[0]:
@@ -1,7 +1,9 @@
+import math
 from functools import lru_cache
 from typing import Optional
 
 import numpy as np
+from fontTools.pens.basePen import BasePen
 from glyphsLib import GSFont, GSGlyph, GSLayer, GSPath, GSComponent
 from glyphsLib import LINE, CURVE, QCURVE, OFFCURVE
 from glyphsLib.types import Transform
@@ -44,29 +46,24 @@ def get_layer_height(layer: GSLayer) -> float:
     return height
 
 
-def _emit_truetype_qspline(offcurves: list, endpoint, ascender: float, scaling: float) -> str:
+def _emit_truetype_qspline(offcurves: list[tuple[float, float]], endpoint: tuple[float, float]) -> str:
     '''
     Emit SVG quadratic commands for a TrueType spline with implicit on-curve points.
     Multiple consecutive off-curves have implicit midpoints between them.
+    Points are expected to already be in SVG coordinates.
     '''
-    # Transform node position to SVG coordinates
-    svg_coords = lambda node: (node.position.x * scaling, (ascender - node.position.y) * scaling)
-
     parts = []
-    for i, offcurve in enumerate(offcurves):
-        ctrl = svg_coords(offcurve)
-        
+    for i, (ctrl_x, ctrl_y) in enumerate(offcurves):
         if i < len(offcurves) - 1:
             # Implicit on-curve point at midpoint between consecutive off-curves
-            next_off = offcurves[i + 1]
-            mid_x = (offcurve.position.x + next_off.position.x) / 2
-            mid_y = (offcurve.position.y + next_off.position.y) / 2
-            end = mid_x * scaling, (ascender - mid_y) * scaling
+            next_x, next_y = offcurves[i + 1]
+            end_x = (ctrl_x + next_x) / 2
+            end_y = (ctrl_y + next_y) / 2
         else:
             # Last off-curve connects to the explicit endpoint
-            end = svg_coords(endpoint)
+            end_x, end_y = endpoint
         
-        parts.append(f'Q {ctrl[0]} {ctrl[1]}, {end[0]} {end[1]}')
+        parts.append('Q %g %g, %g %g' % (ctrl_x, ctrl_y, end_x, end_y))
     return ' '.join(parts)
 
 
@@ -80,53 +77,57 @@ def _path_to_svg_path_data(path: GSPath, ascender: float, scaling: float = 1.0)
         scaling: The scaling factor to apply.
     '''
     # Rotate nodes so the last node is on-curve (required for proper SVG path construction)
-    while path.nodes[-1].type == OFFCURVE:
-        path.nodes.insert(0, path.nodes.pop(-1))
+    # This works on a copy so that the path itself is left untouched
+    nodes = list(path.nodes)
+    while nodes[-1].type == OFFCURVE:
+        nodes.insert(0, nodes.pop(-1))
 
-    # Transform node position to SVG coordinates
-    svg_coords = lambda node: (node.position.x * scaling, (ascender - node.position.y) * scaling)
+    # Transform node positions to SVG coordinates once, as the loop below walks nodes by index
+    # (GSNode.nextNode looks up its own index with a linear search)
+    types = [node.type for node in nodes]
+    positions = np.array([(node.position.x, node.position.y) for node in nodes], dtype=np.float64)
+    xs = (positions[:, 0] * scaling).tolist()
+    ys = ((ascender - positions[:, 1]) * scaling).tolist()
 
     # Start path at the last on-curve point (SVG origin is top-left)
-    start = svg_coords(path.nodes[-1])
-    parts = [f'M {start[0]} {start[1]}']
+    parts = ['M %g %g' % (xs[-1], ys[-1])]
 
     i = 0
-    while i < len(path.nodes):
-        node = path.nodes[i]
+    while i < len(nodes):
+        node_type = types[i]
         
-        if node.type == LINE:
-            p = svg_coords(node)
-            parts.append(f'L {p[0]} {p[1]}')
+        if node_type == LINE:
+            parts.append('L %g %g' % (xs[i], ys[i]))
             i += 1
             
-        elif node.type == OFFCURVE:
-            # Collect consecutive off-curve nodes and return them with the terminal on-curve node.
-            offcurves = [node]
-            endpoint = node.nextNode
-            while endpoint.type == OFFCURVE:
-                offcurves.append(endpoint)
-                endpoint = endpoint.nextNode
-            i += len(offcurves) + 1
+        elif node_type == OFFCURVE:
+            # Collect consecutive off-curve nodes up to the terminal on-curve node.
+            # The last node is on-curve, so this never runs past the end.
+            end = i + 1
+            while types[end] == OFFCURVE:
+                end += 1
+            num_offcurves = end - i
+            end_type = types[end]
             
-            if len(offcurves) == 1:
+            if num_offcurves == 1:
                 # Single off-curve → quadratic Bézier
-                assert endpoint.type == QCURVE, f'Expected QCURVE after single offcurve, got {endpoint.type}'
-                ctrl, end = map(svg_coords, (node, endpoint))
-                parts.append(f'Q {ctrl[0]} {ctrl[1]}, {end[0]} {end[1]}')
+                assert end_type == QCURVE, f'Expected QCURVE after single offcurve, got {end_type}'
+                parts.append('Q %g %g, %g %g' % (xs[i], ys[i], xs[end], ys[end]))
                 
-            elif len(offcurves) == 2 and endpoint.type == CURVE:
+            elif num_offcurves == 2 and end_type == CURVE:
                 # Two off-curves + CURVE → cubic Bézier (PostScript style)
-                c1, c2, end = map(svg_coords, (*offcurves, endpoint))
-                parts.append(f'C {c1[0]} {c1[1]}, {c2[0]} {c2[1]}, {end[0]} {end[1]}')
+                parts.append('C %g %g, %g %g, %g %g' % (xs[i], ys[i], xs[i + 1], ys[i + 1], xs[end], ys[end]))
             
             else:
                 # 2+ off-curves + QCURVE → TrueType quadratic spline with implicit midpoints
-                assert endpoint.type == QCURVE, f'Expected QCURVE after TrueType spline, got {endpoint.type}'
-                parts.append(_emit_truetype_qspline(offcurves, endpoint, ascender, scaling))
+                assert end_type == QCURVE, f'Expected QCURVE after TrueType spline, got {end_type}'
+                offcurves = list(zip(xs[i:end], ys[i:end]))
+                parts.append(_emit_truetype_qspline(offcurves, (xs[end], ys[end])))
+            i = end + 1
                 
-        elif node.type in (CURVE, QCURVE):
+        elif node_type in (CURVE, QCURVE):
             # On-curve nodes should only be reached via off-curve handling
-            raise ValueError(f'Unexpected on-curve node without preceding off-curves: {node}')
+            raise ValueError(f'Unexpected on-curve node without preceding off-curves: {nodes[i]}')
     
     parts.append('Z')  # TODO: Handle open paths?
     return ' '.join(parts)
@@ -242,9 +243,11 @@ def _layer_to_svg_content(layer: GSLayer, ascender: float, scaling: float = 1.0)
     return ''.join(component_parts)
 
 
+@lru_cache(maxsize=4096)
 def layer_to_svg(layer: GSLayer, scaling: float = 1.0, inverted: bool = False, full_svg: bool = True) -> str:
     '''    
     Convert a glyph layer to SVG format code string.
+    Results are cached, so edits made to a layer after converting it are not reflected.
 
     Arguments:
         layer: The glyph layer to convert to SVG.
@@ -271,11 +274,85 @@ def layer_to_svg(layer: GSLayer, scaling: float = 1.0, inverted: bool = False, f
     return svg_code
 
 
+class _SkiaPathPen(BasePen):
+    '''
+    Pen that draws outlines into a skia.Path, in glyph coordinates.
+    TrueType splines are split into quadratic segments by BasePen.
+    '''
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def _moveTo(self, pt):
+        self.path.moveTo(*pt)
+
+    def _lineTo(self, pt):
+        self.path.lineTo(*pt)
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        self.path.cubicTo(*pt1, *pt2, *pt3)
+
+    def _qCurveToOne(self, pt1, pt2):
+        self.path.quadTo(*pt1, *pt2)
+
+    def _closePath(self):
+        self.path.close()
+
+
+def _layer_to_skia_path(layer: GSLayer):
+    '''
+    Convert a glyph layer to a skia.Path in glyph coordinates, resolving components recursively.
+    '''
+    import skia
+
+    path = skia.Path()
+    pen = _SkiaPathPen(path)
+    for shape in layer.shapes:
+        if isinstance(shape, GSComponent):
+            referenced_layer = shape.layer if hasattr(shape, 'layer') else getattr(shape, 'componentLayer', None)
+            if referenced_layer is None:
+                raise ValueError(f'Component "{shape.name}" has no corresponding layer.')
+            # Glyphs transforms (a, b, c, d, x, y) map (X, Y) to (aX + cY + x, bX + dY + y)
+            a, b, c, d, x, y = shape.transform
+            path.addPath(_layer_to_skia_path(referenced_layer), skia.Matrix.MakeAll(a, c, x, b, d, y, 0, 0, 1))
+        elif isinstance(shape, GSPath):
+            shape.draw(pen)
+        else:
+            raise ValueError(f'Unexpected shape: {shape}')
+    return path
+
+
+def _rasterize_layer_skia(layer: GSLayer, scaling: float, inverted: bool) -> np.array:
+    '''
+    Rasterize a glyph layer by drawing its outlines with skia, without going through SVG.
+    '''
+    import skia
+
+    surface = skia.Surface(math.ceil(layer.width * scaling), math.ceil(get_layer_height(layer) * scaling))
+    canvas = surface.getCanvas()
+    canvas.clear(skia.ColorBLACK if inverted else skia.ColorWHITE)
+    # Same placement as layer_to_svg: flip the y-axis and put the ascender at the top
+    canvas.translate(0, layer.master.ascender * scaling)
+    canvas.scale(scaling, -scaling)
+    paint = skia.Paint(AntiAlias=True, Color=skia.ColorWHITE if inverted else skia.ColorBLACK)
+    canvas.drawPath(_layer_to_skia_path(layer), paint)
+    return surface.makeImageSnapshot().toarray()[:, :, 0]
+
+
 def layer_to_numpy(layer: GSLayer, scaling: float = 1.0, inverted: bool = False, method: str = 'pyvips') -> np.array:
     '''
     Rasterize a glyph layer into a grayscale numpy array.
+    Rasters are cached, and each call returns a copy that is safe to modify.
     '''
-    assert method in ('cairo', 'aggdraw', 'pyvips')
+    return _rasterize_layer(layer, scaling, inverted, method).copy()
+
+
+@lru_cache(maxsize=1024)
+def _rasterize_layer(layer: GSLayer, scaling: float, inverted: bool, method: str) -> np.array:
+    assert method in ('cairo', 'aggdraw', 'pyvips', 'skia')
+    if method == 'skia':
+        return _rasterize_layer_skia(layer, scaling, inverted)
     svg_bytes = layer_to_svg(layer, scaling, inverted).encode()
     if method == 'pyvips':
         import pyvips